@@ -1,31 +1,76 @@
 import os
+import functools
+import time
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+from datetime import timedelta
 from typing import Optional
-from jose import jwt, JWTError
+import jwt
 from passlib.context import CryptContext
+from pool import SQLiteConnectionPool
 
 # --- CONFIGURATION ---
 DB_PATH = "/var/lib/wo/wordops-panel_users.db"
 KEY_FILE = "/var/lib/wo/secret.key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
+ACCESS_TOKEN_EXPIRE_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
 
 # --- PERSISTENT SECRET KEY ---
+@functools.cache
 def get_secret_key():
-    os.makedirs(os.path.dirname(KEY_FILE), exist_ok=True)
-    if os.path.exists(KEY_FILE):
-        with open(KEY_FILE, "r") as f: return f.read().strip()
-    else:
-        key = os.urandom(32).hex()
-        with open(KEY_FILE, "w") as f: f.write(key)
+    try:
+        with open(KEY_FILE, "rb") as f: return f.read().strip()
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(KEY_FILE), exist_ok=True)
+        key = os.urandom(32).hex().encode()
+        with open(KEY_FILE, "wb") as f: f.write(key)
         os.chmod(KEY_FILE, 0o600)
         return key
 
 SECRET_KEY = get_secret_key()
 
 # --- SECURITY SETUP ---
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Argon2id starting from the OWASP baseline (46 MiB, t=1, p=1) until configure_argon2()
+# applies the host's tuned cost; hashes made with other parameters are flagged as
+# needing an update and re-hashed on the next good login.
+ARGON2_MEMORY_RANGE_MIB = (32, 256)
+# Concurrent login hashes may use at most this fraction (1/N) of physical RAM between them
+ARGON2_RAM_SHARE = 4
+pwd_context = CryptContext(
+    schemes=["argon2"], deprecated="auto",
+    argon2__type="ID", argon2__memory_cost=47104, argon2__time_cost=1, argon2__parallelism=1,
+    argon2__digest_size=32, argon2__salt_size=16,
+)
+
+# Verified against when a username does not exist, so unknown and known users cost the same
+DUMMY_HASH = pwd_context.hash("invalid")
+
+def configure_argon2(memory_cost, time_cost=1, parallelism=1):
+    global DUMMY_HASH
+    pwd_context.update(argon2__memory_cost=memory_cost, argon2__time_cost=time_cost, argon2__parallelism=parallelism)
+    DUMMY_HASH = pwd_context.hash("invalid")
+
+def argon2_memory_cap_mib(concurrency=1):
+    # Upper bound for memory_cost so `concurrency` simultaneous hashes fit in the host's RAM share
+    lo, hi = ARGON2_MEMORY_RANGE_MIB
+    try: ram_mib = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (ValueError, OSError): return hi
+    return max(lo, min(hi, ram_mib // ARGON2_RAM_SHARE // concurrency))
+
+def autotune_argon2(target_ms=250, concurrency=1):
+    # Binary-search the largest memory_cost (1 MiB steps, t=1, p=1) that hashes within target_ms,
+    # capped by what `concurrency` logins in flight can afford on this host
+    lo, hi = ARGON2_MEMORY_RANGE_MIB[0], argon2_memory_cap_mib(concurrency)
+    best = lo
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        ctx = CryptContext(schemes=["argon2"], argon2__type="ID", argon2__memory_cost=mid * 1024, argon2__time_cost=1, argon2__parallelism=1)
+        start = time.perf_counter()
+        ctx.hash("x" * 12)
+        if (time.perf_counter() - start) * 1000 <= target_ms: best, lo = mid, mid + 1
+        else: hi = mid - 1
+    return best * 1024, 1, 1
 
 def verify_password(plain_password, hashed_password):
     try: return pwd_context.verify(plain_password, hashed_password)
@@ -35,57 +80,85 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    # exp as plain epoch seconds: no datetime/timedelta objects per token
+    lifetime = expires_delta.total_seconds() if expires_delta else ACCESS_TOKEN_EXPIRE_SECONDS
+    return jwt.encode({**data, "exp": int(time.time() + lifetime)}, SECRET_KEY, algorithm=ALGORITHM)
 
 # --- DATABASE MANAGEMENT ---
+db_pool = SQLiteConnectionPool(DB_PATH)
+
+# Hot-path statements as shared constants so each pooled connection reuses its compiled copy
+SQL_GET_PASSWORD_HASH = "SELECT password_hash FROM users WHERE username = ?"
+SQL_SET_PASSWORD_HASH = "UPDATE users SET password_hash=? WHERE username=?"
+SQL_LIST_USERS = "SELECT username FROM users"
+
+# list_users() result as (loaded_at, usernames); loaded_at=0 forces a reload.
+# _users_gen bumps on every add/delete so a reload that raced one is not stored
+USERS_CACHE_TTL = 30
+_users_cache = (0, [])
+_users_gen = 0
+_users_lock = threading.Lock()
+
 def init_user_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password_hash TEXT)''')
-    c.execute("SELECT count(*) FROM users")
-    if c.fetchone()[0] == 0:
-        admin_pass = get_password_hash("wordops")
-        c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", ("admin", admin_pass))
-    conn.commit()
-    conn.close()
+    with db_pool.writer() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute('''CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password_hash TEXT)''')
+        if conn.execute("SELECT count(*) FROM users").fetchone()[0] == 0:
+            admin_pass = get_password_hash("wordops")
+            # OR IGNORE: several workers may seed an empty database at the same time
+            conn.execute("INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)", ("admin", admin_pass))
 
 def add_user(username, password):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        hashed = get_password_hash(password)
-        c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hashed))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError: return False
-    finally: conn.close()
+    hashed = get_password_hash(password)
+    with db_pool.writer() as conn:
+        try:
+            conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hashed))
+            patch_users_cache(added=username)
+            return True
+        except sqlite3.IntegrityError: return False
 
 def update_password(username, new_password):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        hashed = get_password_hash(new_password)
-        c.execute("UPDATE users SET password_hash=? WHERE username=?", (hashed, username))
-        conn.commit()
+    hashed = get_password_hash(new_password)
+    with db_pool.writer() as conn:
+        c = conn.execute(SQL_SET_PASSWORD_HASH, (hashed, username))
         return c.rowcount > 0
-    finally: conn.close()
+
+def authenticate_user(username, password):
+    with db_pool.acquire() as conn:
+        row = conn.execute(SQL_GET_PASSWORD_HASH, (username,)).fetchone()
+    try: ok, new_hash = pwd_context.verify_and_update(password, row[0] if row else DUMMY_HASH)
+    except: return False
+    if not row: return False
+    if ok and new_hash:
+        with db_pool.writer() as conn:
+            conn.execute(SQL_SET_PASSWORD_HASH, (new_hash, username))
+    return ok
 
 def delete_user(username):
     if username == "admin": return False 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM users WHERE username=?", (username,))
-    conn.commit()
-    conn.close()
+    with db_pool.writer() as conn:
+        conn.execute("DELETE FROM users WHERE username=?", (username,))
+        patch_users_cache(removed=username)
     return True
 
+def patch_users_cache(added=None, removed=None):
+    # Called under the writer lock; keeps a loaded list current instead of forcing a re-query
+    global _users_cache, _users_gen
+    with _users_lock:
+        _users_gen += 1
+        loaded_at, users = _users_cache
+        if not loaded_at: return
+        users = [u for u in users if u != removed]
+        if added is not None and added not in users: users.append(added)
+        _users_cache = (loaded_at, users)
+
 def list_users():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT username FROM users")
-    users = [row[0] for row in c.fetchall()]
-    conn.close()
-    return users
\ No newline at end of file
+    global _users_cache
+    loaded_at, users = _users_cache
+    if loaded_at and time.monotonic() - loaded_at < USERS_CACHE_TTL: return list(users)
+    gen = _users_gen
+    with db_pool.acquire() as conn:
+        users = [username for username, in conn.execute(SQL_LIST_USERS)]
+    with _users_lock:
+        if gen == _users_gen: _users_cache = (time.monotonic(), users)
+    return list(users)
@@ -1,48 +1,86 @@
 import subprocess
-import sqlite3
 import os
 import re
 import shutil
 import asyncio
-import requests
+import httpx
 import configparser
 import time
+import threading
 import zipfile
+import html
+import sqlite3
+from collections import deque
+from dataclasses import dataclass
+from types import MappingProxyType
 from datetime import datetime
 from typing import Optional, List
-from fastapi import FastAPI, Request, Form, BackgroundTasks, Depends, HTTPException, UploadFile, File
+from fastapi import FastAPI, Request, Form, Depends, HTTPException, UploadFile, File
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
-from jose import jwt
+from fastapi.responses import Response, HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import jwt
+from pool import SQLiteConnectionPool
 
 # Import Auth
 try:
     from auth import (
-        init_user_db, verify_password, create_access_token, 
-        list_users, add_user, delete_user, 
-        SECRET_KEY, ALGORITHM
+        init_user_db, create_access_token, 
+        list_users, add_user, delete_user, authenticate_user,
+        autotune_argon2, configure_argon2, argon2_memory_cap_mib,
+        db_pool, SECRET_KEY, ALGORITHM
     )
 except ImportError:
     SECRET_KEY = "dummy"
     ALGORITHM = "HS256"
     def init_user_db(): pass
-    def verify_password(p, h): return True
     def create_access_token(d): return "token"
     def list_users(): return ["admin"]
     def add_user(u, p): return True
     def delete_user(u): pass
+    def authenticate_user(u, p): return True
+    def autotune_argon2(target_ms=250, concurrency=1): return 47104, 1, 1
+    def argon2_memory_cap_mib(concurrency=1): return 256
+    def configure_argon2(m, t=1, p=1): pass
+    db_pool = SQLiteConnectionPool("/var/lib/wo/wordops-panel_users.db")
 
 app = FastAPI()
-templates = Jinja2Templates(directory="templates")
+TEMPLATE_DIR = "templates"
+templates = Jinja2Templates(directory=TEMPLATE_DIR)
+templates.env.auto_reload = False  # templates ship with the package; skip the per-render mtime check
 DB_PATH = "/var/lib/wo/wordops-panel_users.db"
 ASSET_DIR = "/var/lib/wordops-panel/assets"
 os.makedirs(ASSET_DIR, exist_ok=True)
 
+# HTMX fragments rendered straight to HTML, loaded once at startup
+FRAGMENTS = ("asset_list_fragment.html", "settings_modal.html")
+fragment_templates = {}
+
 # --- GLOBAL STATE ---
-deployment_state = { "logs": [], "active": False, "current_site": "", "progress": 0 }
+# Console keeps only the newest lines so each poll re-renders a bounded amount of HTML
+CONSOLE_MAX_LINES = 500
+deployment_state = { "logs": deque(maxlen=CONSOLE_MAX_LINES), "seq": 0, "active": False, "current_site": "", "progress": 0 }
+# (loop, asyncio.Event) per open /console/stream, woken by log_msg
+console_waiters = set()
+# Concurrent deployments share the console; keeps line append + seq bump atomic
+console_lock = threading.Lock()
+# Deployments run as tasks on the event loop; at most this many wo/wp-cli pipelines touch the filesystem at once
+DEPLOY_CONCURRENCY = 2
+# Argon2 hashes in flight for /login; with memory_cost this caps login memory regardless of request rate
+LOGIN_HASH_CONCURRENCY = 2
+# One mutable dict per domain, updated in place by the deploy tasks; finished entries are pruned after a minute.
+# Holds each domain's asyncio task for /progress/{domain}/cancel, so it stays in-process (the panel runs one worker)
+deployment_progress = {}
+PROGRESS_RETENTION = 60
+
+# Decoded JWT claims keyed by the raw cookie value: token -> (username, fresh_until)
+TOKEN_CACHE_SIZE = 4096
+TOKEN_CACHE_TTL = 60
+token_cache = {}
 
 # --- REPO DATA ---
-REPO_PLUGINS = [
+# Read-only at runtime, so frozen once here and shared by every render
+REPO_PLUGINS = tuple(MappingProxyType(p) for p in [
     {"name": "Elementor", "slug": "elementor", "type": "plugin", "source": "repo"},
     {"name": "Yoast SEO", "slug": "wordpress-seo", "type": "plugin", "source": "repo"},
     {"name": "WooCommerce", "slug": "woocommerce", "type": "plugin", "source": "repo"},
@@ -50,85 +88,241 @@ REPO_PLUGINS = [
     {"name": "Classic Editor", "slug": "classic-editor", "type": "plugin", "source": "repo"},
     {"name": "Astra", "slug": "astra", "type": "theme", "source": "repo"},
     {"name": "Hello Elementor", "slug": "hello-elementor", "type": "theme", "source": "repo"}
-]
+])
 
 # --- HELPERS ---
+# ANSI escape sequences, plus the bare "[94m" remnants WordOps sometimes leaves behind
+ANSI_RE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])|\[[0-9;]+m')
+# One pass over `wo site info` for every label the dashboard needs
+SITE_INFO_RE = re.compile(r"Type\s+:\s+(?P<type>\w+)|PHP Version\s+:\s+(?P<php>\d\.\d)|User\s+:\s+(?P<user>\S+)")
+WP_DEFINE_RE = re.compile(r"define\(\s*['\"](DB_NAME|DB_USER|DB_PASSWORD)['\"]\s*,\s*['\"](.*?)['\"]\s*\);")
+WP_DEFINE_KEYS = {"DB_NAME": "db_name", "DB_USER": "db_user", "DB_PASSWORD": "db_pass"}
+PHP_ADMIN_VALUE_RE = re.compile(r"php_admin_value\[(\w+)\] = (.*)")
+WP_LOGIN_URL_RE = re.compile(r"(https?://\S+/wp-login\.php\?\S+)")
+
 def clean_ansi(text):
     if not text: return ""
-    # 1. Remove standard ANSI escape codes
-    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-    text = ansi_escape.sub('', text)
-    # 2. Remove lingering bracket codes often seen in WordOps output (e.g., [94m)
-    text = re.sub(r'\[[0-9;]+m', '', text)
-    # 3. Remove non-printable characters just in case
-    text = "".join(ch for ch in text if ch.isprintable())
+    # 1. Remove escape codes and bracket remnants in a single pass
+    if "\x1b" in text or "[" in text: text = ANSI_RE.sub('', text)
+    # 2. Remove non-printable characters; the C-level check lets clean lines skip the filter
+    if not text.isprintable(): text = "".join(ch for ch in text if ch.isprintable())
     return text.strip()
 
 def log_msg(msg, color="text-gray-300"):
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    deployment_state["logs"].append(f'<div class="{color} font-mono text-xs border-b border-gray-800/50 py-1"><span class="opacity-50 mr-2">[{timestamp}]</span>{msg}</div>')
+    # Deploy tasks log from the event loop, so lines go straight into the console; a burst of
+    # calls between awaits still wakes each SSE stream only once
+    line = f'<div class="{color} font-mono text-xs border-b border-gray-800/50 py-1"><span class="opacity-50 mr-2">[{datetime.now():%H:%M:%S}]</span>{msg}</div>'
+    with console_lock:
+        deployment_state["logs"].append(line)
+        deployment_state["seq"] += 1
+    notify_console()
+
+def set_progress(domain, percent, status):
+    p = deployment_progress.get(domain)
+    if p is None: return
+    p["percent"] = percent
+    p["status"] = status
+    if percent >= 100: p["finished_at"] = time.monotonic()
+
+def prune_progress():
+    # Only touched from the event loop, so no lock is needed
+    now = time.monotonic()
+    for domain in [d for d, p in deployment_progress.items() if p["finished_at"] and now - p["finished_at"] > PROGRESS_RETENTION]:
+        del deployment_progress[domain]
+
+def notify_console():
+    for loop, event in list(console_waiters):
+        try: loop.call_soon_threadsafe(event.set)
+        except RuntimeError: pass  # loop already closed
 
 def get_wp_config(domain):
     config_path = f"/var/www/{domain}/wp-config.php"
     creds = {"db_name": "Unknown", "db_user": "Unknown", "db_pass": "Unknown", "db_host": "localhost"}
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, "r", errors="ignore") as f: content = f.read()
-            db_name = re.search(r"define\(\s*['\"]DB_NAME['\"]\s*,\s*['\"](.*?)['\"]\s*\);", content)
-            db_user = re.search(r"define\(\s*['\"]DB_USER['\"]\s*,\s*['\"](.*?)['\"]\s*\);", content)
-            db_pass = re.search(r"define\(\s*['\"]DB_PASSWORD['\"]\s*,\s*['\"](.*?)['\"]\s*\);", content)
-            if db_name: creds["db_name"] = db_name.group(1)
-            if db_user: creds["db_user"] = db_user.group(1)
-            if db_pass: creds["db_pass"] = db_pass.group(1)
-        except: pass
+    try:
+        # The DB defines sit near the top; read 8 KiB at a time and stop once all three are seen
+        found = set()
+        content = ""
+        with open(config_path, "r", errors="ignore") as f:
+            while len(found) < len(WP_DEFINE_KEYS) and (chunk := f.read(8192)):
+                content += chunk
+                for key, value in WP_DEFINE_RE.findall(content):
+                    # First definition wins, as PHP itself ignores later redefinitions
+                    if key not in found: found.add(key); creds[WP_DEFINE_KEYS[key]] = value
+    except: pass
     return creds
 
 def get_php_settings(domain, php_ver):
     settings = { "memory_limit": "256M", "max_execution_time": "300", "post_max_size": "100M", "upload_max_filesize": "100M", "max_input_vars": "3000" }
     override_file = f"/etc/php/{php_ver}/fpm/pool.d/{domain}.conf"
-    if os.path.exists(override_file):
-        try:
-            with open(override_file, "r") as f: content = f.read()
-            for key in settings.keys():
-                match = re.search(f"php_admin_value\\[{key}\\] = (.*)", content)
-                if match: settings[key] = match.group(1).strip()
-        except: pass
+    try:
+        with open(override_file, "r") as f: content = f.read()
+        found = set()
+        for key, value in PHP_ADMIN_VALUE_RE.findall(content):
+            if key in settings and key not in found: found.add(key); settings[key] = value.strip()
+    except: pass
     return settings
 
+def render_fragment(name, **context):
+    tpl = fragment_templates.get(name) or templates.get_template(name)
+    return HTMLResponse(tpl.render(**context))
+
+# Vault listing memoised on the directory's mtime; uploads/deletes change it
+assets_cache = {"mtime": -1, "value": []}
+
 def get_local_assets():
+    try: mtime = os.stat(ASSET_DIR).st_mtime_ns
+    except OSError: return []
+    if mtime == assets_cache["mtime"]: return assets_cache["value"]
     assets = []
-    if os.path.exists(ASSET_DIR):
-        for f in os.listdir(ASSET_DIR):
-            if f.endswith(".zip"):
-                asset_type = "theme" if "theme" in f.lower() else "plugin"
-                display_name = f.replace("theme_", "").replace("plugin_", "").replace(".zip", "")
-                assets.append({"name": display_name, "slug": os.path.join(ASSET_DIR, f), "type": asset_type, "source": "vault"})
+    try: it = os.scandir(ASSET_DIR)
+    except FileNotFoundError: return []
+    with it:
+        for entry in it:
+            if entry.name.endswith(".zip") and entry.is_file(follow_symlinks=False): assets.append(vault_asset(entry.name, entry.path))
+    assets_cache.update(mtime=mtime, value=assets)
     return assets
 
+# Listing rows are read-only once built; slots keep them small and templates read them as attributes
+@dataclass(slots=True, frozen=True)
+class VaultAsset:
+    name: str
+    slug: str
+    type: str
+    source: str = "vault"
+
+def vault_asset(f, path):
+    asset_type = "theme" if "theme" in f.lower() else "plugin"
+    display_name = f.replace("theme_", "").replace("plugin_", "").replace(".zip", "")
+    return VaultAsset(display_name, path, asset_type)
+
+def patch_assets_cache(path, added):
+    # We know exactly which file changed, so update the cached listing instead of rescanning.
+    # The patched list is a new object, which also tells get_all_assets to rebuild its merge.
+    if assets_cache["mtime"] == -1: return  # nothing cached yet; the next read scans
+    try: mtime = os.stat(ASSET_DIR).st_mtime_ns
+    except OSError: assets_cache["mtime"] = -1; return
+    assets = [a for a in assets_cache["value"] if a.slug != path]
+    name = os.path.basename(path)
+    if added and name.endswith(".zip"): assets.append(vault_asset(name, path))
+    assets_cache.update(mtime=mtime, value=assets)
+
+# REPO_PLUGINS + vault, rebuilt only when get_local_assets() hands back a new list
+all_assets_cache = {"vault": None, "value": []}
+
+def get_all_assets():
+    vault = get_local_assets()
+    if all_assets_cache["vault"] is not vault:
+        all_assets_cache.update(vault=vault, value=[*REPO_PLUGINS, *vault])
+    return all_assets_cache["value"]
+
+async def run_command(*args, input=None, check=False, capture=True):
+    # Async counterpart of subprocess.run(capture_output=True, text=True) for request handlers;
+    # capture=False sends output to /dev/null when only the return code matters
+    out_pipe = asyncio.subprocess.PIPE if capture else asyncio.subprocess.DEVNULL
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdin=asyncio.subprocess.PIPE if input is not None else None,
+        stdout=out_pipe, stderr=out_pipe)
+    try: out, err = await proc.communicate(input.encode() if input is not None else None)
+    except asyncio.CancelledError:
+        # A cancelled deployment must not leave wo/wp-cli running behind it
+        try: proc.kill()
+        except ProcessLookupError: pass
+        raise
+    res = subprocess.CompletedProcess(args, proc.returncode, (out or b"").decode(errors="replace"), (err or b"").decode(errors="replace"))
+    if check: res.check_returncode()
+    return res
+
+UPLOAD_CHUNK = 1024 * 1024
+
+def save_upload(src, dest_path):
+    # Written to a .part file and renamed into place, so the vault never lists a half-written zip
+    part_path = dest_path + ".part"
+    try: copy_upload(src, part_path)
+    except:
+        try: os.unlink(part_path)
+        except FileNotFoundError: pass
+        raise
+    os.replace(part_path, dest_path)
+
+def copy_upload(src, dest_path):
+    fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, "posix_fadvise"): os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        # Anything with a real fd is copied by the kernel (sendfile); an in-memory spool rolls over on fileno()
+        if hasattr(os, "sendfile"):
+            try:
+                src_fd, offset = src.fileno(), 0
+                while True:
+                    sent = os.sendfile(fd, src_fd, offset, UPLOAD_CHUNK * 8)
+                    if not sent: return
+                    offset += sent
+            except OSError:  # includes io.UnsupportedOperation from objects without an fd
+                src.seek(0); os.ftruncate(fd, 0); os.lseek(fd, 0, os.SEEK_SET)
+        # Otherwise copy it in 1 MiB reads
+        with open(fd, "wb", closefd=False) as dst: shutil.copyfileobj(src, dst, UPLOAD_CHUNK)
+    finally: os.close(fd)
+
 # --- DB & SETTINGS ---
+# In-process mirror of the settings table, loaded at startup and written through on save
+settings_cache = {}
+settings_lock = threading.RLock()
+SQL_SAVE_SETTING = "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)"
+
 def get_setting(key):
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        row = conn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
-        conn.close()
-        return row[0] if row else None
-    except: return None
+    return settings_cache.get(key)
 
 def save_setting(key, value):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
-        conn.commit()
-        conn.close()
+        with settings_lock:
+            with db_pool.writer() as conn:
+                conn.execute(SQL_SAVE_SETTING, (key, value))
+            settings_cache[key] = value
     except: pass
 
+def save_settings_bulk(pairs):
+    # Connections run in autocommit mode, so wrap the batch in one explicit transaction (one WAL commit).
+    # A failed COMMIT is rolled back too, so the pooled connection never goes back mid-transaction; errors propagate
+    with settings_lock:
+        with db_pool.writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(SQL_SAVE_SETTING, pairs)
+                conn.execute("COMMIT")
+            except:
+                if conn.in_transaction: conn.execute("ROLLBACK")
+                raise
+        settings_cache.update(pairs)
+
 @app.on_event("startup")
 def startup_event():
+    with db_pool.writer() as conn:
+        conn.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
+        rows = conn.execute("SELECT key, value FROM settings").fetchall()
+    with settings_lock: settings_cache.update(rows)
+    # Argon2 cost is measured on first boot and persisted, so every later start reuses it;
+    # re-measured if the stored cost no longer fits the login concurrency limit on this host's RAM
+    argon2_params = get_setting("argon2_params")
+    if not argon2_params or int(argon2_params.split(",")[0]) > argon2_memory_cap_mib(LOGIN_HASH_CONCURRENCY) * 1024:
+        argon2_params = ",".join(str(v) for v in autotune_argon2(concurrency=LOGIN_HASH_CONCURRENCY))
+        save_setting("argon2_params", argon2_params)
+        print("Argon2 parameters tuned (memory_cost KiB, time_cost, parallelism): " + argon2_params, flush=True)
+    configure_argon2(*(int(v) for v in argon2_params.split(",")))
     init_user_db()
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
-    conn.commit()
-    conn.close()
+    # Compile every page up front so no request pays Jinja's parse/compile cost
+    with os.scandir(TEMPLATE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".html"): templates.get_template(entry.name)
+    for name in FRAGMENTS: fragment_templates[name] = templates.get_template(name)
+    # One pooled client for site probes so repeat checks reuse the TCP/TLS connection; never use it for downloads
+    app.state.http = httpx.AsyncClient(verify=False, timeout=2.0, limits=httpx.Limits(max_connections=32, max_keepalive_connections=16))
+    # asyncio primitives are created here, inside the serving loop, rather than at import
+    app.state.deploy_sem = asyncio.Semaphore(DEPLOY_CONCURRENCY)
+    app.state.sites_lock = asyncio.Lock()
+    app.state.login_sem = asyncio.Semaphore(LOGIN_HASH_CONCURRENCY)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await app.state.http.aclose()
 
 # --- AUTH ---
 @app.middleware("http")
@@ -142,75 +336,223 @@ async def auth_exception_handler(request, exc):
     if exc.status_code == 401: return RedirectResponse(url="/login")
     return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
 
+# Panel tokens carry no aud/iss claims, so only the signature, exp and sub are checked
+JWT_ALGORITHMS = [ALGORITHM]
+JWT_DECODE_OPTIONS = {"require": ["exp", "sub"], "verify_aud": False, "verify_iss": False}
+
+def decode_token(token):
+    # access_token cookie -> username, or None; shared by get_current_user and /auth/check
+    if not token: return None
+    now = time.time()
+    cached = token_cache.get(token)
+    if cached:
+        if cached[1] > now: return cached[0]
+        token_cache.pop(token, None)
+    scheme, _, raw = token.partition(" ")
+    # Malformed cookies are rejected before any base64/HMAC work
+    if scheme != "Bearer" or raw.count(".") != 2: return None
+    try: payload = jwt.decode(raw, SECRET_KEY, algorithms=JWT_ALGORITHMS, options=JWT_DECODE_OPTIONS)
+    except jwt.InvalidTokenError: return None
+    sub, exp = payload.get("sub"), payload.get("exp")
+    if not sub or not exp: return None
+    # Never trust a cached entry past the token's own expiry
+    if len(token_cache) >= TOKEN_CACHE_SIZE: token_cache.clear()
+    token_cache[token] = (sub, min(exp, now + TOKEN_CACHE_TTL))
+    return sub
+
 async def get_current_user(request: Request):
-    token = request.cookies.get("access_token")
-    if not token: raise HTTPException(status_code=401)
-    try:
-        payload = jwt.decode(token.split(" ")[1], SECRET_KEY, algorithms=[ALGORITHM])
-        if not payload.get("sub"): raise HTTPException(status_code=401)
-        return payload.get("sub")
-    except: raise HTTPException(status_code=401)
+    user = decode_token(request.cookies.get("access_token"))
+    if not user: raise HTTPException(status_code=401)
+    return user
+
+@app.get("/auth/check")
+async def auth_check(request: Request):
+    # nginx auth_request target for the WordOps backend (see postinst): 200 allows, 401 denies.
+    # Hit on every subrequest, so it answers from the token cache without a redirect or body.
+    return Response(status_code=200 if decode_token(request.cookies.get("access_token")) else 401)
 
 # --- CLOUDFLARED ---
+cloudflared_bin = {"path": None}
+
+def cloudflared_installed():
+    # The binary only appears on install, so remember a hit instead of forking `which` per poll
+    if not cloudflared_bin["path"]: cloudflared_bin["path"] = shutil.which("cloudflared")
+    return cloudflared_bin["path"] is not None
+
 @app.get("/settings/cloudflared-status")
 async def cf_status():
     try:
-        if subprocess.run(["which", "cloudflared"], capture_output=True).returncode != 0: s = "Not Installed"
-        elif "active" in subprocess.run(["systemctl", "is-active", "cloudflared"], capture_output=True, text=True).stdout: s = "Running"
+        if not cloudflared_installed(): s = "Not Installed"
+        elif (await run_command("systemctl", "is-active", "cloudflared")).stdout.startswith("active"): s = "Running"
         else: s = "Stopped"
     except: s = "Unknown"
     c = "text-green-500" if s == "Running" else "text-red-500"
     return HTMLResponse(f'<span class="font-bold {c}">{s}</span>')
 
+WEB_READY_TIMEOUT = 2.0
+
+def web_stack_units():
+    # nginx plus one php<ver>-fpm unit per PHP installed under /etc/php
+    units = ["nginx"]
+    try:
+        with os.scandir("/etc/php") as it: units += [f"php{e.name}-fpm" for e in it if os.path.isdir(os.path.join(e.path, "fpm"))]
+    except OSError: pass
+    return units
+
+async def wait_web_stack(timeout=WEB_READY_TIMEOUT):
+    # Return as soon as systemd reports every web unit active, rather than a fixed sleep
+    cmd = ["systemctl", "is-active", "--quiet", *web_stack_units()]
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            if (await run_command(*cmd, capture=False)).returncode == 0: return True
+        except OSError: break
+        await asyncio.sleep(0.05)
+    return False
+
+def extract_zip(archive, target_dir):
+    # Member-by-member extraction through a 1 MiB copy buffer; entries resolving outside target_dir (Zip Slip) are skipped
+    root = os.path.realpath(target_dir) + os.sep
+    with zipfile.ZipFile(archive) as z:
+        for zi in z.infolist():
+            dest = os.path.realpath(os.path.join(root, zi.filename))
+            if not dest.startswith(root): continue
+            if zi.is_dir(): os.makedirs(dest, exist_ok=True); continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with z.open(zi) as src, open(dest, "wb") as dst: shutil.copyfileobj(src, dst, UPLOAD_CHUNK)
+
+# `cloudflared tunnel login` per panel user; the task drains its output and reaps the process
+cf_logins = {}
+URL_RE = re.compile(r"https://\S+")
+CF_LOGIN_POLL = '<div hx-get="/settings/cloudflared-login-status" hx-trigger="load delay:2s" hx-swap="outerHTML"></div>'
+
+async def track_cf_login(proc, output):
+    async for line in proc.stdout: output.append(clean_ansi(line.decode(errors="ignore")))
+    return await proc.wait()
+
+CLOUDFLARED_DEB_URL = "https://github.com/cloudflare/cloudflared/releases/latest/download/cloudflared-linux-amd64.deb"
+DOWNLOAD_RETRIES = 3
+
+async def fetch_file(client, url, dest):
+    # Stream to disk, retrying with exponential backoff (1s, 2s)
+    for attempt in range(DOWNLOAD_RETRIES):
+        try:
+            async with client.stream("GET", url, follow_redirects=True, timeout=httpx.Timeout(30.0, connect=5.0)) as r:
+                r.raise_for_status()
+                with open(dest, "wb") as f:
+                    async for chunk in r.aiter_bytes(UPLOAD_CHUNK): f.write(chunk)
+            return
+        except httpx.HTTPError:
+            if attempt == DOWNLOAD_RETRIES - 1: raise
+            await asyncio.sleep(2 ** attempt)
+
 @app.post("/settings/install-cloudflared")
-async def install_cf(method: str = Form(...), token: Optional[str] = Form(None), cf_email: Optional[str] = Form(None), cf_key: Optional[str] = Form(None)):
+async def install_cf(method: str = Form(...), token: Optional[str] = Form(None), cf_email: Optional[str] = Form(None), cf_key: Optional[str] = Form(None), user: str = Depends(get_current_user)):
     async def process():
         def log(m, c="text-gray-300"): return f'<div class="{c} font-mono text-xs mb-1">> {m}</div>'
         yield log("Initializing...", "text-blue-400")
         await asyncio.sleep(0.5)
         try:
-            if subprocess.run(["which", "cloudflared"], capture_output=True).returncode != 0:
+            if not cloudflared_installed():
                 yield log("Downloading binary...", "text-yellow-400")
-                subprocess.run(["curl", "-L", "-o", "cf.deb", "https://github.com/cloudflare/cloudflared/releases/latest/download/cloudflared-linux-amd64.deb"], check=True)
-                subprocess.run(["sudo", "dpkg", "-i", "cf.deb"], check=True)
-                subprocess.run(["rm", "cf.deb"])
+                # The .deb is installed as root, so it gets its own TLS-verifying client; app.state.http skips verification for site probes
+                async with httpx.AsyncClient(verify=True) as client: await fetch_file(client, CLOUDFLARED_DEB_URL, "cf.deb")
+                await run_command("sudo", "dpkg", "-i", "cf.deb", check=True, capture=False)
+                try: os.unlink("cf.deb")
+                except FileNotFoundError: pass
             
             if method == "token" and token:
                 t = token.strip()
                 if not t.startswith("ey"): yield log("Invalid Token", "text-red-500"); return
-                subprocess.run(["sudo", "cloudflared", "service", "uninstall"], capture_output=True)
-                if os.path.exists("/etc/systemd/system/cloudflared.service"): subprocess.run(["sudo", "rm", "-f", "/etc/systemd/system/cloudflared.service"])
-                subprocess.run(["sudo", "systemctl", "daemon-reload"])
+                await run_command("sudo", "cloudflared", "service", "uninstall", capture=False)
+                try: os.unlink("/etc/systemd/system/cloudflared.service")
+                except FileNotFoundError: pass
+                await run_command("sudo", "systemctl", "daemon-reload", capture=False)
                 try:
-                    subprocess.run(["sudo", "cloudflared", "service", "install", t], check=True)
-                    subprocess.run(["sudo", "systemctl", "start", "cloudflared"])
+                    await run_command("sudo", "cloudflared", "service", "install", t, check=True, capture=False)
+                    await run_command("sudo", "systemctl", "start", "cloudflared", capture=False)
                     yield log("Tunnel Installed & Started!", "text-green-400")
                     yield '<script>htmx.trigger("#cf-status-area", "load");</script>'
                 except Exception as e: yield log(f"Error: {e}", "text-red-500")
             elif method == "login":
                 if cf_email and cf_key: save_setting("cf_email", cf_email); save_setting("cf_key", cf_key)
-                yield log("Starting Login...", "text-blue-400")
-                subprocess.Popen(["cloudflared", "tunnel", "login"])
+                login = cf_logins.get(user)
+                if login and not login["task"].done(): yield log("Login already in progress.", "text-yellow-400")
+                else:
+                    yield log("Starting Login...", "text-blue-400")
+                    proc = await asyncio.create_subprocess_exec("cloudflared", "tunnel", "login", stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+                    output = []
+                    cf_logins[user] = {"task": asyncio.create_task(track_cf_login(proc, output)), "output": output}
+                yield CF_LOGIN_POLL
         except Exception as e: yield log(f"Error: {e}", "text-red-600")
         yield log("Done.")
     return StreamingResponse(process(), media_type="text/html")
 
+@app.get("/settings/cloudflared-login-status")
+async def cf_login_status(user: str = Depends(get_current_user)):
+    login = cf_logins.get(user)
+    if not login: return HTMLResponse('<div class="text-gray-500 font-mono text-xs mb-1">> No login in progress.</div>')
+    url = next((m.group(0) for line in login["output"] if (m := URL_RE.search(line))), None)
+    link = f'<div class="font-mono text-xs mb-1">> Authorize: <a href="{url}" target="_blank" class="text-blue-400 underline break-all">{url}</a></div>' if url else ""
+    if not login["task"].done(): return HTMLResponse(link + CF_LOGIN_POLL)
+    cf_logins.pop(user, None)
+    try: ok = login["task"].result() == 0
+    except Exception: ok = False
+    if ok: return HTMLResponse('<div class="text-green-400 font-mono text-xs mb-1">> Login complete.</div><script>htmx.trigger("#cf-status-area", "load");</script>')
+    tail = clean_ansi(login["output"][-1]) if login["output"] else "cloudflared exited"
+    return HTMLResponse(f'<div class="text-red-500 font-mono text-xs mb-1">> Login failed: {tail}</div>')
+
 # --- ASSETS ---
 @app.post("/assets/upload")
 async def upload_asset(request: Request, type: str = Form(...), file: UploadFile = File(...)):
     try:
         filename = f"{'theme_' if type == 'themes' else 'plugin_'}{file.filename}"
-        with open(os.path.join(ASSET_DIR, filename), "wb+") as f: shutil.copyfileobj(file.file, f)
-        return templates.TemplateResponse("asset_list_fragment.html", {"request": request, "assets": get_local_assets()})
+        path = os.path.join(ASSET_DIR, filename)
+        await run_in_threadpool(save_upload, file.file, path)
+        patch_assets_cache(path, added=True)
+        return render_fragment("asset_list_fragment.html", assets=get_local_assets())
     except: return HTMLResponse("Error uploading")
+    finally: await file.close()
 
 @app.delete("/assets/delete")
 async def delete_asset(request: Request, path: str = Form(...)):
-    if os.path.exists(path) and path.startswith(ASSET_DIR): os.remove(path)
-    return templates.TemplateResponse("asset_list_fragment.html", {"request": request, "assets": get_local_assets()})
+    # Resolve symlinks and ".." first, then require the result to still sit inside the vault
+    root = os.path.realpath(ASSET_DIR)
+    real = os.path.realpath(path)
+    if os.path.commonpath([real, root]) == root and os.path.isfile(real):
+        os.remove(real); patch_assets_cache(os.path.join(ASSET_DIR, os.path.relpath(real, root)), added=False)
+    return render_fragment("asset_list_fragment.html", assets=get_local_assets())
 
 # --- DASHBOARD & SITE MGMT ---
 
+# The config viewer is read-only; anything past this is cut off with a note
+NGINX_CONF_MAX_CHARS = 64 * 1024
+
+# Static badge markup, pre-encoded once; HTMLResponse passes bytes through without re-encoding
+SSL_BADGE_SECURE = b'<span class="text-green-500 font-bold text-xs border border-green-200 bg-green-50 px-2 py-1 rounded">SECURE</span>'
+SSL_BADGE_INSECURE = b'<span class="text-red-500 font-bold text-xs border border-red-200 bg-red-50 px-2 py-1 rounded">Not Secure</span>'
+SSL_TOGGLE_RESULT = {
+    True: b'<span class="text-green-600 dark:text-green-400 font-bold text-xs">SSL Enabled</span>',
+    False: b'<span class="text-green-600 dark:text-green-400 font-bold text-xs">SSL Disabled</span>',
+}
+SSL_TOGGLE_FAILED = b'<span class="text-red-600 dark:text-red-400 font-bold text-xs">Failed</span>'
+
+# domain -> (secure, expires_at); certificates change on a minute scale, not per poll.
+# Keyed by a URL parameter, so bounded: a full cache is dropped, as with token_cache
+SSL_CACHE_TTL = 60
+SSL_CACHE_SIZE = 1024
+ssl_cache = {}
+
+async def probe_https(domain):
+    secure, expires_at = ssl_cache.get(domain, (False, 0))
+    if time.monotonic() < expires_at: return secure
+    # Any non-5xx answer over TLS counts as secure (local cert or Cloudflare proxy)
+    try: secure = (await app.state.http.head(f"https://{domain}", follow_redirects=False)).status_code < 500
+    except Exception: secure = False
+    if len(ssl_cache) >= SSL_CACHE_SIZE: ssl_cache.clear()
+    ssl_cache[domain] = (secure, time.monotonic() + SSL_CACHE_TTL)
+    return secure
+
 @app.get("/site/{domain}/dashboard", response_class=HTMLResponse)
 async def site_dashboard(request: Request, domain: str, user: str = Depends(get_current_user)):
     domain_clean = clean_ansi(domain)
@@ -221,33 +563,33 @@ async def site_dashboard(request: Request, domain: str, user: str = Depends(get_
     ssl_status = "Disabled"
     site_user = domain_clean.replace(".", "")
     info = ""
+    # The HTTPS probe only matters when SSL is not local, but starting it now overlaps it with `wo site info`;
+    # sites the cached list already marks as SSL-enabled skip it
+    cached = await get_site(domain_clean)
+    probe = None if cached and cached.ssl == "Enabled" else asyncio.create_task(probe_https(domain_clean))
 
     try:
-        res = subprocess.run(["/usr/local/bin/wo", "site", "info", domain_clean], capture_output=True, text=True)
+        res = await run_command("/usr/local/bin/wo", "site", "info", domain_clean)
         info = clean_ansi(res.stdout)
         
-        # Parse Info with robust checks
-        match_type = re.search(r"Type\s+:\s+(\w+)", info)
-        if match_type: site_type = match_type.group(1)
-
-        match_php = re.search(r"PHP Version\s+:\s+(\d\.\d)", info)
-        if match_php: php_ver = match_php.group(1)
+        # Parse Info with robust checks; first occurrence of each label wins
+        found = {}
+        for m in SITE_INFO_RE.finditer(info):
+            found.setdefault(m.lastgroup, m.group(m.lastgroup))
+        site_type = found.get("type", site_type)
+        php_ver = found.get("php", php_ver)
+        site_user = found.get("user", site_user)
 
         if "SSL : Enabled" in info:
             ssl_status = "Enabled (Local)"
         
-        match_user = re.search(r"User\s+:\s+(\S+)", info)
-        if match_user: site_user = match_user.group(1)
-        
     except Exception:
         pass # Fallback to defaults if command fails completely
 
     # Check Cloudflare SSL only if not enabled locally
     if ssl_status == "Disabled":
-        try:
-            check = requests.head(f"https://{domain_clean}", timeout=2, verify=False)
-            if check.status_code < 500: ssl_status = "Secure (Proxied)"
-        except: pass
+        if await (probe or probe_https(domain_clean)): ssl_status = "Secure (Proxied)"
+    elif probe: probe.cancel()
     
     site_data = {
         "domain": domain_clean, "type": site_type, "php": php_ver, "ssl": ssl_status,
@@ -256,13 +598,16 @@ async def site_dashboard(request: Request, domain: str, user: str = Depends(get_
         "nginx": ""
     }
     
-    # Nginx Config
-    conf_path = f"/var/www/{domain_clean}/conf/nginx/ssl.conf"
-    if not os.path.exists(conf_path): conf_path = f"/etc/nginx/sites-available/{domain_clean}"
-    if os.path.exists(conf_path):
+    # Nginx Config: the site's ssl.conf if present, else its sites-available vhost
+    for conf_path in (f"/var/www/{domain_clean}/conf/nginx/ssl.conf", f"/etc/nginx/sites-available/{domain_clean}"):
         try:
-            with open(conf_path, "r") as f: site_data["nginx"] = f.read()
-        except: pass
+            with open(conf_path, "r") as f: site_data["nginx"] = f.read(NGINX_CONF_MAX_CHARS + 1)
+        except FileNotFoundError: continue
+        except: break
+        if len(site_data["nginx"]) > NGINX_CONF_MAX_CHARS:
+            site_data["nginx"] = site_data["nginx"][:NGINX_CONF_MAX_CHARS]
+            site_data["nginx_truncated"] = True
+        break
 
     return templates.TemplateResponse("site_dashboard.html", {
         "request": request, "site": site_data, "user": user, "admin_users": list_users()
@@ -275,7 +620,7 @@ async def update_php(domain: str, version: str = Form(...)):
     domain = clean_ansi(domain).strip()
     clean_ver = version.replace(".", "")
     cmd = ["/usr/local/bin/wo", "site", "update", domain, f"--php{clean_ver}"]
-    proc = subprocess.run(cmd, capture_output=True, text=True)
+    proc = await run_command(*cmd)
     if proc.returncode == 0:
         return HTMLResponse(f'<div class="p-4 mb-4 text-sm text-green-800 rounded-lg bg-green-50 dark:bg-green-900 dark:text-green-300">Success! Updated to PHP {version}.</div>')
     err = clean_ansi(proc.stderr or proc.stdout)
@@ -288,30 +633,54 @@ async def save_php_settings(domain: str, version: str = Form(...), memory_limit:
     content = f"[{domain}]\nphp_admin_value[memory_limit] = {memory_limit}\nphp_admin_value[max_execution_time] = {max_execution_time}\nphp_admin_value[post_max_size] = {post_max_size}\nphp_admin_value[upload_max_filesize] = {upload_max_filesize}\nphp_admin_value[max_input_vars] = {max_input_vars}\n"
     try:
         with open(conf_file, "w") as f: f.write(content)
-        subprocess.run(["sudo", "systemctl", "restart", f"php{version}-fpm"])
+        await run_command("sudo", "systemctl", "restart", f"php{version}-fpm", capture=False)
         return HTMLResponse('<span class="text-green-600 dark:text-green-400 font-bold text-sm">Settings Saved & PHP Restarted</span>')
     except Exception as e: return HTMLResponse(f'<span class="text-red-600 dark:text-red-400 font-bold text-sm">Error: {e}</span>')
 
+# Let's Encrypt issuance takes 30-60 s, so toggles run as tasks and the form polls for the result
+ssl_jobs = {}
+
+async def run_ssl_toggle(domain, enable):
+    cmd = ["/usr/local/bin/wo", "site", "update", domain]
+    cmd.append("--le" if enable else "--nossl")
+    if (await run_command(*cmd, capture=False)).returncode != 0: return SSL_TOGGLE_FAILED
+    ssl_cache.pop(domain, None)
+    invalidate_sites_cache()
+    return SSL_TOGGLE_RESULT[enable]
+
+def ssl_progress_poll(domain):
+    return f'<span hx-get="/site/{domain}/ssl-progress" hx-trigger="load delay:2s" hx-swap="outerHTML" class="text-gray-500 font-bold text-xs animate-pulse">Updating SSL...</span>'
+
 @app.post("/site/{domain}/toggle-ssl")
 async def toggle_ssl(domain: str, enable: bool = Form(...)):
     domain = clean_ansi(domain)
-    cmd = ["/usr/local/bin/wo", "site", "update", domain]
-    cmd.append("--le" if enable else "--nossl")
-    if subprocess.run(cmd, capture_output=True).returncode == 0:
-        return HTMLResponse(f'<span class="text-green-600 dark:text-green-400 font-bold text-xs">SSL {"Enabled" if enable else "Disabled"}</span>')
-    return HTMLResponse('<span class="text-red-600 dark:text-red-400 font-bold text-xs">Failed</span>')
+    job = ssl_jobs.get(domain)
+    if not job or job.done(): ssl_jobs[domain] = asyncio.create_task(run_ssl_toggle(domain, enable))
+    return HTMLResponse(ssl_progress_poll(domain))
+
+@app.get("/site/{domain}/ssl-progress")
+async def ssl_progress(domain: str):
+    domain = clean_ansi(domain)
+    job = ssl_jobs.get(domain)
+    if not job: return HTMLResponse("")
+    if not job.done(): return HTMLResponse(ssl_progress_poll(domain))
+    ssl_jobs.pop(domain, None)
+    try: return HTMLResponse(job.result())
+    except Exception: return HTMLResponse(SSL_TOGGLE_FAILED)
 
 @app.delete("/site/{domain}/delete")
 async def delete_site(domain: str):
     domain = clean_ansi(domain)
-    subprocess.run(["/usr/local/bin/wo", "site", "delete", domain, "--no-prompt"])
+    await run_command("/usr/local/bin/wo", "site", "delete", domain, "--no-prompt", capture=False)
+    ssl_cache.pop(domain, None)
+    invalidate_sites_cache()
     return HTMLResponse('<script>window.location.href = "/";</script>')
 
 @app.post("/site/{domain}/reset-password")
 async def reset_password(domain: str, password: str = Form(...)):
     domain = clean_ansi(domain)
     cmd = ["/usr/local/bin/wp", "user", "update", "1", f"--user_pass={password}", f"--path=/var/www/{domain}/htdocs", "--allow-root"]
-    proc = subprocess.run(cmd, capture_output=True, text=True)
+    proc = await run_command(*cmd)
     if proc.returncode == 0:
         return HTMLResponse('<div class="text-green-600 dark:text-green-400 text-sm font-bold mt-2">Password Updated!</div>')
     err = clean_ansi(proc.stderr or proc.stdout)
@@ -323,16 +692,16 @@ async def site_autologin(domain: str):
     try:
         # Method 1: WP-CLI Login Command
         cmd = ["/usr/local/bin/wp", "login", "create", "1", "--url-only", "--allow-root", f"--path=/var/www/{domain}/htdocs"]
-        proc = subprocess.run(cmd, capture_output=True, text=True)
+        proc = await run_command(*cmd)
         if proc.returncode == 0 and "http" in proc.stdout:
             return RedirectResponse(proc.stdout.strip())
     except: pass
 
     # Method 2: WordOps Info
     try:
-        res = subprocess.run(["/usr/local/bin/wo", "site", "info", domain, "--url"], capture_output=True, text=True)
+        res = await run_command("/usr/local/bin/wo", "site", "info", domain, "--url")
         clean_out = clean_ansi(res.stdout)
-        match = re.search(r"(https?://\S+/wp-login\.php\?\S+)", clean_out)
+        match = WP_LOGIN_URL_RE.search(clean_out)
         if match: return RedirectResponse(match.group(1))
     except: pass
 
@@ -342,15 +711,25 @@ async def site_autologin(domain: str):
 @app.get("/site/{domain}/check-ssl")
 async def check_ssl_status(domain: str):
     domain = clean_ansi(domain)
-    try:
-        response = requests.head(f"https://{domain}", timeout=2, verify=False)
-        if response.status_code < 500:
-            return HTMLResponse('<span class="text-green-500 font-bold text-xs border border-green-200 bg-green-50 px-2 py-1 rounded">SECURE</span>')
-    except: pass
-    return HTMLResponse('<span class="text-red-500 font-bold text-xs border border-red-200 bg-red-50 px-2 py-1 rounded">Not Secure</span>')
+    return HTMLResponse(SSL_BADGE_SECURE if await probe_https(domain) else SSL_BADGE_INSECURE)
 
 # --- DEPLOYMENT CONSOLE & LOGIC ---
 
+SCROLL_CONSOLE_JS = '<script>document.getElementById("scroll-anchor").scrollIntoView({ behavior: "smooth" });</script>'
+
+def console_header():
+    return f"""
+            <div class="flex justify-between items-center mb-2 border-b border-gray-700 pb-1">
+                <span class="text-xs font-bold uppercase text-blue-400">Target: {deployment_state['current_site']}</span>
+                <span class="text-xs { 'text-green-400 animate-pulse' if deployment_state['active'] else 'text-gray-400' }">
+                    { 'DEPLOYING...' if deployment_state['active'] else 'FINISHED' }
+                </span>
+            </div>"""
+
+def sse_event(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return head + f"event: {event}\n" + "".join(f"data: {line}\n" for line in data.splitlines() or [""]) + "\n"
+
 @app.get("/console/logs")
 async def get_console_logs():
     if not deployment_state["active"] and not deployment_state["logs"]:
@@ -361,12 +740,7 @@ async def get_console_logs():
     
     return HTMLResponse(f"""
         <div {trigger} hx-get="/console/logs" hx-swap="outerHTML">
-            <div class="flex justify-between items-center mb-2 border-b border-gray-700 pb-1">
-                <span class="text-xs font-bold uppercase text-blue-400">Target: {deployment_state['current_site']}</span>
-                <span class="text-xs { 'text-green-400 animate-pulse' if deployment_state['active'] else 'text-gray-400' }">
-                    { 'DEPLOYING...' if deployment_state['active'] else 'FINISHED' }
-                </span>
-            </div>
+            {console_header()}
             <div class="space-y-1">
                 {log_html}
             </div>
@@ -375,9 +749,71 @@ async def get_console_logs():
         </div>
     """)
 
+@app.get("/console/stream")
+async def console_stream(request: Request):
+    # Server-Sent Events: push new console lines as they are logged instead of a 1s poll.
+    # Event ids are the line sequence number, so an EventSource reconnect resumes via Last-Event-ID.
+    async def events():
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        console_waiters.add(waiter)
+        last_id = request.headers.get("last-event-id", "")
+        sent = int(last_id) if last_id.isdigit() else deployment_state["seq"] - len(deployment_state["logs"])
+        try:
+            while True:
+                event.clear()
+                with console_lock: logs, seq = list(deployment_state["logs"]), deployment_state["seq"]
+                if seq < sent: sent = seq - len(logs)  # a new batch reset the console
+                if seq > sent:
+                    new = logs[-min(seq - sent, len(logs)):]
+                    sent = seq
+                    yield sse_event("log", "".join(new), sent)
+                    yield sse_event("status", console_header() + SCROLL_CONSOLE_JS)
+                if not deployment_state["active"]:
+                    final = (await get_console_logs()).body.decode()
+                    yield sse_event("done", f'<div class="flex-1 p-4 overflow-y-auto">{final}</div>')
+                    return
+                try: await asyncio.wait_for(event.wait(), 15)
+                except asyncio.TimeoutError: yield ": keep-alive\n\n"
+        finally: console_waiters.discard(waiter)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Poll path only: hit every second per deploying domain, so rendered with str.format rather than Jinja.
+# The first render in create_site uses progress_fragment.html; keep the two in step.
+PROGRESS_POLL = 'hx-get="/progress/{domain}" hx-trigger="load delay:1s" hx-swap="outerHTML"'
+PROGRESS_HTML = """<div class="p-6" {poll}>
+    <h3 class="text-lg font-medium text-gray-900 dark:text-white mb-4">Deploying {domain}...</h3>
+    <div class="w-full bg-gray-200 dark:bg-gray-700 rounded-full h-4 mb-2 overflow-hidden">
+        <div class="bg-primary-600 h-4 rounded-full transition-all duration-500 ease-out" style="width: {percent}%"></div>
+    </div>
+    <div class="flex justify-between text-xs">
+        <span class="font-bold text-primary-600">{percent}%</span>
+        <span class="text-gray-500 dark:text-gray-400 font-medium {pulse}">{status}</span>
+        {cancel}
+    </div>
+</div>"""
+PROGRESS_CANCEL = '<button hx-post="/progress/{domain}/cancel" hx-swap="none" class="text-red-500 hover:text-red-700 font-bold uppercase">Cancel</button>'
+
+@app.get("/progress/{domain}")
+async def get_progress(domain: str):
+    domain = clean_ansi(domain)
+    p = deployment_progress.get(domain)
+    if p is None: return HTMLResponse("")
+    done = bool(p["finished_at"])
+    return HTMLResponse(PROGRESS_HTML.format(
+        poll=PROGRESS_POLL.format(domain=html.escape(domain)) if not done else "", domain=html.escape(domain),
+        percent=p["percent"], status=html.escape(p["status"]), pulse="" if done else "animate-pulse",
+        cancel=PROGRESS_CANCEL.format(domain=html.escape(domain)) if not done else ""))
+
+@app.post("/progress/{domain}/cancel")
+async def cancel_deployment(domain: str, user: str = Depends(get_current_user)):
+    # The deploy task marks itself Cancelled; the next /progress poll shows it
+    task = deployment_progress.get(clean_ansi(domain), {}).get("task")
+    if task and not task.done(): task.cancel()
+    return Response(status_code=204)
+
 @app.post("/create-site")
 async def create_site(
-    bg: BackgroundTasks, 
     domains: str = Form(...), 
     username: str = Form(...), 
     email: str = Form(...), 
@@ -386,82 +822,146 @@ async def create_site(
     install: Optional[List[str]] = Form(None), 
     activate: Optional[List[str]] = Form(None)
 ):
-    deployment_state["logs"] = []
-    deployment_state["active"] = True
-    deployment_state["progress"] = 0
+    with console_lock:
+        deployment_state["logs"].clear()
+        deployment_state["seq"] = 0
+        deployment_state["active"] = True
+        deployment_state["progress"] = 0
     
     domain_list = [d.strip() for d in re.split(r'[,\n\s]+', domains) if d.strip()]
+    prune_progress()
+    for domain in domain_list: deployment_progress[domain] = {"percent": 0, "status": "Queued", "finished_at": 0}
+    completed = []
     
-    def run_deployment():
-        log_msg(f"Starting batch deployment for {len(domain_list)} sites...", "text-blue-300 font-bold")
+    async def deploy_one(i, domain):
+        with console_lock: deployment_state["current_site"] = domain
+        log_msg(f"--- Deploying {domain} ({i+1}/{len(domain_list)}) ---", "text-yellow-300 font-bold")
         
-        for i, domain in enumerate(domain_list):
-            deployment_state["current_site"] = domain
-            log_msg(f"--- Deploying {domain} ({i+1}/{len(domain_list)}) ---", "text-yellow-300 font-bold")
-            
-            cmd = ["/usr/local/bin/wo", "site", "create", domain, "--wp", f"--email={email}", f"--user={username}", "--wpredis" if stack == "redis" else "--wpfc"]
-            log_msg(f"Running: {' '.join(cmd)}")
+        cmd = ["/usr/local/bin/wo", "site", "create", domain, "--wp", f"--email={email}", f"--user={username}", "--wpredis" if stack == "redis" else "--wpfc"]
+        log_msg(f"Running: {' '.join(cmd)}")
+        set_progress(domain, 10, "Creating site...")
+        
+        try:
+            proc = await run_command(*cmd, input=f"{password}\n{password}")
             
-            try:
-                proc = subprocess.run(cmd, input=f"{password}\n{password}", capture_output=True, text=True)
-                
-                if proc.returncode == 0:
-                    log_msg("Site created successfully.", "text-green-400")
-                    if install:
-                        log_msg("Fixing permissions before assets...", "text-gray-500")
-                        subprocess.run(["/usr/local/bin/wo", "stack", "restart", "--web"], capture_output=True)
-                        time.sleep(2)
-                        
-                        log_msg(f"Installing {len(install)} assets...", "text-blue-200")
-                        for asset_slug in install:
-                            if "/" in asset_slug: # Vault Asset
-                                log_msg(f"Unpacking {os.path.basename(asset_slug)}...", "text-gray-400")
-                                try:
-                                    is_theme = "theme_" in os.path.basename(asset_slug)
-                                    target_sub = "themes" if is_theme else "plugins"
-                                    target_dir = f"/var/www/{domain}/htdocs/wp-content/{target_sub}"
-                                    with zipfile.ZipFile(asset_slug, 'r') as zip_ref: zip_ref.extractall(target_dir) 
-                                    subprocess.run(["chown", "-R", "www-data:www-data", target_dir])
-                                    log_msg(f"Extracted to {target_sub}.", "text-green-500")
-                                    if activate and asset_slug in activate:
-                                        plugin_name = os.path.basename(asset_slug).replace("plugin_", "").replace("theme_", "").replace(".zip", "")
-                                        cli_type = "theme" if is_theme else "plugin"
-                                        cli_cmd = ["/usr/local/bin/wp", cli_type, "activate", plugin_name, "--allow-root", f"--path=/var/www/{domain}/htdocs"]
-                                        res = subprocess.run(cli_cmd, capture_output=True, text=True)
-                                        if res.returncode == 0: log_msg(f"Activated {plugin_name}", "text-green-300")
-                                        else: log_msg(f"Activation failed: {res.stderr}", "text-red-400")
-                                except Exception as e: log_msg(f"Asset Error: {e}", "text-red-400")
-                            else: # Repo Plugin
-                                repo_asset = next((item for item in REPO_PLUGINS if item["slug"] == asset_slug), None)
-                                is_theme = repo_asset and repo_asset["type"] == "theme"
-                                wo_flag = "--theme" if is_theme else "--plugin"
-                                log_msg(f"Installing {asset_slug}...", "text-gray-400")
-                                subprocess.run(["/usr/local/bin/wo", "site", "update", domain, "--wp", f"{wo_flag}=install", f"{wo_flag}={asset_slug}"], capture_output=True)
+            if proc.returncode == 0:
+                log_msg("Site created successfully.", "text-green-400")
+                invalidate_sites_cache()
+                set_progress(domain, 60, "Site created")
+                if install:
+                    set_progress(domain, 70, "Installing assets...")
+                    log_msg("Fixing permissions before assets...", "text-gray-500")
+                    await run_command("/usr/local/bin/wo", "stack", "restart", "--web", capture=False)
+                    await wait_web_stack()
+                    
+                    log_msg(f"Installing {len(install)} assets...", "text-blue-200")
+                    # Repo assets are grouped so each (type, activate) pair costs one wp-cli bootstrap, not one per slug
+                    wp_cmd = ["/usr/local/bin/wp", "--allow-root", f"--path=/var/www/{domain}/htdocs"]
+                    repo_batches = {}
+                    vault_activate = {"plugin": [], "theme": []}
+                    for asset_slug in install:
+                        if "/" in asset_slug: # Vault Asset
+                            log_msg(f"Unpacking {os.path.basename(asset_slug)}...", "text-gray-400")
+                            try:
+                                is_theme = "theme_" in os.path.basename(asset_slug)
+                                target_sub = "themes" if is_theme else "plugins"
+                                await run_in_threadpool(extract_zip, asset_slug, f"/var/www/{domain}/htdocs/wp-content/{target_sub}")
+                                log_msg(f"Extracted to {target_sub}.", "text-green-500")
                                 if activate and asset_slug in activate:
-                                    subprocess.run(["/usr/local/bin/wo", "site", "update", domain, "--wp", f"{wo_flag}=activate", f"{wo_flag}={asset_slug}"], capture_output=True)
-                                    log_msg(f"Activated {asset_slug}.", "text-green-300")
-                else:
-                    clean_err = clean_ansi(proc.stderr or proc.stdout)
-                    log_msg(f"Creation Failed: {clean_err}", "text-red-500 font-bold")
-            
-            except Exception as e:
-                log_msg(f"Critical Error: {str(e)}", "text-red-600 font-bold")
-                
+                                    plugin_name = os.path.basename(asset_slug).replace("plugin_", "").replace("theme_", "").replace(".zip", "")
+                                    vault_activate["theme" if is_theme else "plugin"].append(plugin_name)
+                            except Exception as e: log_msg(f"Asset Error: {e}", "text-red-400")
+                        else: # Repo Plugin
+                            repo_asset = next((item for item in REPO_PLUGINS if item["slug"] == asset_slug), None)
+                            cli_type = "theme" if repo_asset and repo_asset["type"] == "theme" else "plugin"
+                            repo_batches.setdefault((cli_type, bool(activate and asset_slug in activate)), []).append(asset_slug)
+
+                    if repo_batches: set_progress(domain, 80, "Installing repository assets...")
+                    for (cli_type, do_activate), slugs in repo_batches.items():
+                        log_msg(f"Installing {cli_type}s: {', '.join(slugs)}...", "text-gray-400")
+                        res = await run_command(*wp_cmd, cli_type, "install", *slugs, *(["--activate"] if do_activate else []))
+                        if res.returncode == 0: log_msg(f"Installed{' and activated' if do_activate else ''} {', '.join(slugs)}.", "text-green-300")
+                        else: log_msg(f"Install failed: {clean_ansi(res.stderr or res.stdout)}", "text-red-400")
+
+                    # Only one theme can be active, so as before the last one selected wins
+                    if vault_activate["theme"]: vault_activate["theme"] = vault_activate["theme"][-1:]
+                    if vault_activate["plugin"] or vault_activate["theme"]: set_progress(domain, 90, "Activating assets...")
+                    for cli_type, names in vault_activate.items():
+                        if not names: continue
+                        res = await run_command(*wp_cmd, cli_type, "activate", *names)
+                        if res.returncode == 0: log_msg(f"Activated {', '.join(names)}", "text-green-300")
+                        else: log_msg(f"Activation failed: {res.stderr}", "text-red-400")
+
+                    # wp-cli and the extractor both run as root; hand wp-content back in one pass
+                    await run_command("chown", "-R", "www-data:www-data", f"/var/www/{domain}/htdocs/wp-content", capture=False)
+                set_progress(domain, 100, "Done")
+            else:
+                clean_err = clean_ansi(proc.stderr or proc.stdout)
+                log_msg(f"Creation Failed: {clean_err}", "text-red-500 font-bold")
+                set_progress(domain, 100, "Failed")
+        
+        except asyncio.CancelledError:
+            log_msg(f"Deployment of {domain} cancelled.", "text-red-400")
+            set_progress(domain, 100, "Cancelled")
+            raise
+        except Exception as e:
+            log_msg(f"Critical Error: {str(e)}", "text-red-600 font-bold")
+            set_progress(domain, 100, "Failed")
+        finally:
+            with console_lock:
+                completed.append(domain)
+                deployment_state["progress"] = len(completed) * 100 // len(domain_list)
+
+    async def deploy_slot(i, domain):
+        try:
+            async with app.state.deploy_sem: await deploy_one(i, domain)
+        except asyncio.CancelledError:
+            # Cancelled while still queued for a slot; deploy_one reports cancellations once it has started
+            p = deployment_progress.get(domain)
+            if p and not p["finished_at"]:
+                log_msg(f"Deployment of {domain} cancelled.", "text-red-400")
+                set_progress(domain, 100, "Cancelled")
+                with console_lock:
+                    completed.append(domain)
+                    deployment_state["progress"] = len(completed) * 100 // len(domain_list)
+            raise
+
+    async def run_deployment():
+        log_msg(f"Starting batch deployment for {len(domain_list)} sites...", "text-blue-300 font-bold")
+        # One task per domain, kept in deployment_progress so /progress/{domain}/cancel can stop a single site
+        tasks = []
+        for i, domain in enumerate(domain_list):
+            deployment_progress[domain]["task"] = t = asyncio.create_task(deploy_slot(i, domain))
+            tasks.append(t)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # A domain probed before it existed would otherwise keep its "Not Secure" badge for the TTL
+        for domain in domain_list: ssl_cache.pop(domain, None)
+        
         log_msg("Batch Deployment Complete.", "text-green-500 font-bold text-lg")
         deployment_state["active"] = False
         deployment_state["current_site"] = "Done"
+        invalidate_sites_cache()
+        notify_console()
 
-    bg.add_task(run_deployment)
+    # Strong reference so the batch task is not garbage-collected mid-deploy
+    deployment_state["task"] = asyncio.create_task(run_deployment())
     
-    return HTMLResponse("""
+    # One progress bar per domain; each re-polls /progress/{domain} until its entry reports done
+    progress_tpl = templates.get_template("progress_fragment.html")
+    progress_bars = "".join(progress_tpl.render(domain=d, percent=0, status="Queued", done=False) for d in domain_list)
+    return HTMLResponse(f"""
         <div class="fixed inset-0 z-50 flex items-center justify-center bg-gray-900 bg-opacity-90 backdrop-blur-sm">
             <div class="bg-black w-full max-w-4xl h-[600px] rounded-lg shadow-2xl border border-gray-700 flex flex-col font-mono">
                 <div class="flex justify-between items-center px-4 py-2 bg-gray-800 border-b border-gray-700 rounded-t-lg">
                     <span class="text-gray-100 font-bold text-sm">Deployment Console</span>
                     <button onclick="window.location.reload()" class="text-gray-400 hover:text-white text-xs uppercase font-bold border border-gray-600 px-2 py-1 rounded transition hover:bg-gray-700">Close & Refresh</button>
                 </div>
-                <div class="flex-1 p-4 overflow-y-auto" hx-get="/console/logs" hx-trigger="load">
-                    <span class="text-blue-500">Initializing console connection...</span>
+                <div class="max-h-48 overflow-y-auto bg-white dark:bg-gray-800 border-b border-gray-700">{progress_bars}</div>
+                <div class="flex-1 p-4 overflow-y-auto" hx-ext="sse" sse-connect="/console/stream">
+                    <div sse-swap="status"><span class="text-blue-500">Initializing console connection...</span></div>
+                    <div id="console-lines" class="space-y-1" sse-swap="log" hx-swap="beforeend"></div>
+                    <div id="scroll-anchor"></div>
+                    <div sse-swap="done" hx-target="closest [sse-connect]" hx-swap="outerHTML"></div>
                 </div>
             </div>
         </div>
@@ -470,51 +970,109 @@ async def create_site(
 # --- STANDARD ROUTES ---
 @app.get("/settings/modal")
 async def settings(request: Request):
-    return templates.TemplateResponse("settings_modal.html", {
-        "request": request,
-        "cf_email": get_setting("cf_email"),
-        "cf_key": get_setting("cf_key"),
-        "cf_status": "Unknown",
-        "admin_users": list_users()
-    })
+    return render_fragment("settings_modal.html", cf_email=get_setting("cf_email"), cf_key=get_setting("cf_key"), cf_status="Unknown", admin_users=list_users())
 
 @app.post("/settings/save")
 async def save_settings_route(cf_email: str = Form(""), cf_key: str = Form("")):
-    save_setting("cf_email", cf_email); save_setting("cf_key", cf_key)
+    try: save_settings_bulk([("cf_email", cf_email), ("cf_key", cf_key)])
+    except sqlite3.Error as e: return HTMLResponse(f'<div class="text-red-600 dark:text-red-400 font-bold">Error: {html.escape(str(e))}</div>')
     return HTMLResponse('<div class="text-green-600 dark:text-green-400 font-bold">Saved.</div>')
 
-@app.get("/", response_class=HTMLResponse)
-async def home(request: Request, user: str = Depends(get_current_user)):
+# WordOps' own site registry, opened read-only so the panel never touches its journal mode
+WO_DB_PATH = "/var/lib/wo/dbase.db"
+wo_db_pool = SQLiteConnectionPool(f"file:{WO_DB_PATH}?mode=ro", uri=True)
+SQL_LIST_WO_SITES = "SELECT sitename, site_type, is_ssl, php_version FROM sites ORDER BY id"
+SQL_GET_WO_SITE = "SELECT sitename, site_type, is_ssl, php_version FROM sites WHERE sitename = ? LIMIT 1"
+
+@dataclass(slots=True, frozen=True)
+class Site:
+    domain: str
+    type: str
+    php: str
+    ssl: str
+    user: str
+
+def wo_site_row(name, site_type, is_ssl, php):
+    return Site(name, site_type or "wp", php or "8.2", "Enabled" if is_ssl else "Disabled", name.replace(".", ""))
+
+def get_wo_sites():
+    with wo_db_pool.acquire() as conn: return [wo_site_row(*r) for r in conn.execute(SQL_LIST_WO_SITES)]
+
+def get_wo_site(domain):
+    with wo_db_pool.acquire() as conn: r = conn.execute(SQL_GET_WO_SITE, (domain,)).fetchone()
+    return wo_site_row(*r) if r else None
+
+# Site list, reused for a few seconds across page loads; create/delete invalidate it
+SITES_CACHE_TTL = 5.0
+# "gen" bumps on invalidation so a load that raced a create/delete is not stored as fresh
+sites_cache = {"loaded_at": 0, "gen": 0, "value": [], "by_domain": {}}
+
+def invalidate_sites_cache():
+    sites_cache["loaded_at"] = 0
+    sites_cache["gen"] += 1
+
+def sites_cache_fresh():
+    loaded_at = sites_cache["loaded_at"]
+    return loaded_at and time.monotonic() - loaded_at < SITES_CACHE_TTL
+
+async def get_sites():
+    if sites_cache_fresh(): return sites_cache["value"]
+    # Concurrent misses share one load instead of each querying/forking
+    async with app.state.sites_lock:
+        if sites_cache_fresh(): return sites_cache["value"]
+        gen = sites_cache["gen"]
+        sites = await load_sites()
+        if sites is not None and gen == sites_cache["gen"]: sites_cache.update(loaded_at=time.monotonic(), value=sites, by_domain={s.domain: s for s in sites})
+        return sites or []
+
+async def get_site(domain):
+    # Served from the cached list while fresh; otherwise one indexed row rather than reloading every site
+    if sites_cache_fresh(): return sites_cache["by_domain"].get(domain)
+    try: return await run_in_threadpool(get_wo_site, domain)
+    except sqlite3.Error: pass
+    await get_sites()
+    return sites_cache["by_domain"].get(domain)
+
+async def load_sites():
+    try: return await run_in_threadpool(get_wo_sites)
+    except sqlite3.Error: pass  # no readable WordOps database; ask the CLI instead
     sites = []
     try:
-        res = subprocess.run(["/usr/local/bin/wo", "site", "list"], capture_output=True, text=True)
+        res = await run_command("/usr/local/bin/wo", "site", "list")
         raw = [clean_ansi(s) for s in res.stdout.splitlines() if s.strip()]
         for s in raw: 
             parts = s.split()
             domain = parts[0]
             user_guess = domain.replace(".", "")
-            sites.append({
-                "domain": domain, 
-                "type": "wp", 
-                "php": "8.2", 
-                "ssl": "Unknown",
-                "user": user_guess
-            })
-    except: pass
-    return templates.TemplateResponse("index.html", {"request": request, "sites": sites, "user": user, "admin_users": list_users(), "all_assets": REPO_PLUGINS + get_local_assets(), "assets": get_local_assets()})
+            sites.append(Site(domain, "wp", "8.2", "Unknown", user_guess))
+    except: return None
+    return sites
+
+@app.get("/", response_class=HTMLResponse)
+async def home(request: Request, user: str = Depends(get_current_user)):
+    sites = await get_sites()
+    return templates.TemplateResponse("index.html", {"request": request, "sites": sites, "user": user, "admin_users": list_users(), "all_assets": get_all_assets(), "assets": get_local_assets()})
 
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request): return templates.TemplateResponse("login.html", {"request": request})
 
 @app.post("/login")
 async def login(request: Request, username: str = Form(...), password: str = Form(...)):
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor(); c.execute("SELECT password_hash FROM users WHERE username = ?", (username,)); row = c.fetchone(); conn.close()
-    if not row or not verify_password(password, row[0]): return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid"})
+    # argon2 verification takes ~250 ms of CPU; keep it off the event loop, and bounded since unknown users hash too
+    async with app.state.login_sem: ok = await run_in_threadpool(authenticate_user, username, password)
+    if not ok: return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid"})
     resp = RedirectResponse(url="/", status_code=303); resp.set_cookie("access_token", f"Bearer {create_access_token({'sub': username})}", httponly=True); return resp
 
 @app.get("/logout")
-async def logout(): r = RedirectResponse("/login"); r.delete_cookie("access_token"); return r
+async def logout(request: Request):
+    token = request.cookies.get("access_token")
+    if token: token_cache.pop(token, None)
+    r = RedirectResponse("/login"); r.delete_cookie("access_token"); return r
 
 if __name__ == "__main__":
+    # Settings, users, deployment progress and the console are cached in-process with no cross-process
+    # invalidation, so a second worker would serve stale settings; refuse to start rather than drift
+    workers = int(os.environ.get("WORDOPS_PANEL_WORKERS", "1"))
+    if workers != 1: raise SystemExit(f"WORDOPS_PANEL_WORKERS={workers} is not supported; the panel runs a single worker")
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False, log_level="info")
\ No newline at end of file
@@ -0,0 +1,52 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# --- SQLITE CONNECTION POOL ---
+class SQLiteConnectionPool:
+    """Bounded pool of reusable SQLite connections, opened lazily on first use."""
+
+    def __init__(self, db_path, size=4, uri=False):
+        self.db_path = db_path
+        self.size = size
+        self.uri = uri
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, uri=self.uri)
+        # journal_mode=WAL is persistent and set once by init_user_db; these are per-connection
+        # _write_lock only serializes writers within one process; extra uvicorn workers wait here instead
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-20000")
+        conn.execute("PRAGMA mmap_size=134217728")
+        return conn
+
+    def _checkout(self):
+        try: return self._idle.get_nowait()
+        except queue.Empty: pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try: return self._connect()
+                except:
+                    self._opened -= 1
+                    raise
+        return self._idle.get()
+
+    @contextmanager
+    def acquire(self):
+        conn = self._checkout()
+        try: yield conn
+        finally: self._idle.put(conn)
+
+    @contextmanager
+    def writer(self):
+        # SQLite allows one writer at a time; queue writers here rather than in busy_timeout retries
+        with self._write_lock, self.acquire() as conn: yield conn